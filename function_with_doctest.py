@@ -1,8 +1,86 @@
+from functools import lru_cache
+from importlib.util import find_spec
+
+import numpy as np
 import pandas as pd
 import seaborn as sns
-from scipy import stats
+from scipy import special, stats
 from matplotlib import pyplot as plt
 
+BOSTON_CRIME_COLUMNS = ['INCIDENT_NUMBER', 'OFFENSE_CODE', 'OFFENSE_CODE_GROUP', 'OFFENSE_DESCRIPTION',
+                        'OCCURRED_ON_DATE', 'YEAR', 'DAY_OF_WEEK', 'HOUR', 'STREET', 'Lat', 'Long']
+BOSTON_CRIME_DTYPES = {'OFFENSE_CODE': 'int32', 'YEAR': 'int16', 'HOUR': 'int8', 'OFFENSE_CODE_GROUP': 'category',
+                       'DAY_OF_WEEK': 'category', 'STREET': 'category', 'OCCURRED_ON_DATE': str}
+BOSTON_BUILDING_COLUMNS = ['id', 'building_typology', 'st_name', 'st_name_suf', 'ct_perc_income_200000_or_more',
+                           'ct_perc_low_to_no_income']
+MONTH_NAMES = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+MONTH_NUMBERS = {name: '%02d' % number for number, name in enumerate(MONTH_NAMES, 1)}
+# use the multi-threaded pyarrow csv parser if it is installed
+CSV_ENGINE = 'pyarrow' if find_spec('pyarrow') is not None else 'c'
+
+
+def read_csv(path: str, **kwargs) -> pd.DataFrame:
+    """
+    Read a csv file with the fastest available engine
+    :param path: path of csv file
+    :param kwargs: other arguments of pd.read_csv
+    :return: dataframe of data
+
+    >>> read_csv('prep_data/boston_bldg_by_building_typology.csv').shape
+    (13348, 3)
+    """
+    return pd.read_csv(path, engine=CSV_ENGINE, **kwargs)
+
+
+def sorted_category(values: pd.Series) -> pd.Series:
+    """
+    Convert a series to categorical dtype whose categories are sorted, so grouping by it keeps the sorted order
+    :param values: a series
+    :return: a categorical series
+
+    >>> sorted_category(pd.Series(['b', 'a', 'b'])).cat.categories.tolist()
+    ['a', 'b']
+    """
+    values = values.astype('category')
+    return values.cat.reorder_categories(values.cat.categories.sort_values())
+
+
+def group_count(keys: pd.Series) -> (np.ndarray, np.ndarray):
+    """
+    Count the amount of every distinct value in a series, missing values are ignored
+    :param keys: a series of group keys
+    :return: an array of sorted distinct keys and an array of their counts
+
+    >>> uniques, counts = group_count(pd.Series(['b', 'a', 'b', None]))
+    >>> uniques.tolist(), counts.tolist()
+    (['a', 'b'], [1, 2])
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return np.asarray(uniques), counts
+
+
+def pair_group_count(first_keys: pd.Series, second_keys: pd.Series) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Count the amount of every observed pair of values in two series, pairs with missing values are ignored
+    :param first_keys: a series of first group keys
+    :param second_keys: a series of second group keys with the same length
+    :return: arrays of first keys, second keys and their counts, sorted by first key and then second key
+
+    >>> first, second, counts = pair_group_count(pd.Series(['b', 'a', 'b', 'b']), pd.Series([1, 2, 1, 2]))
+    >>> first.tolist(), second.tolist(), counts.tolist()
+    (['a', 'b', 'b'], [2, 1, 2], [1, 2, 1])
+    """
+    first_codes, first_uniques = pd.factorize(first_keys, sort=True)
+    second_codes, second_uniques = pd.factorize(second_keys, sort=True)
+    valid = (first_codes >= 0) & (second_codes >= 0)
+    codes = first_codes[valid].astype(np.int64) * len(second_uniques) + second_codes[valid]
+    counts = np.bincount(codes, minlength=len(first_uniques) * len(second_uniques))
+    counts = counts.reshape(len(first_uniques), len(second_uniques))
+    first_index, second_index = np.nonzero(counts)
+    return (np.asarray(first_uniques.take(first_index)), np.asarray(second_uniques.take(second_index)),
+            counts[first_index, second_index])
+
 
 def combine_weather(crime_data: pd.DataFrame, weather_data: pd.DataFrame) -> pd.DataFrame:
     """
@@ -18,14 +96,41 @@ def combine_weather(crime_data: pd.DataFrame, weather_data: pd.DataFrame) -> pd.
     >>> combine_weather(crime, weather).iloc[0]['TAVG']
     '26'
     """
-    crime_data = crime_data.groupby(['OCCURRED_ON_DATE']).size().reset_index(name='crime_count')
-    weather_data = weather_data.set_index('DATE')
-    crime_data = crime_data.set_index('OCCURRED_ON_DATE')
-    crime_with_weather = pd.concat([weather_data, crime_data], axis=1, join='inner')
-    crime_with_weather = crime_with_weather.drop(columns=['STATION', 'NAME'])
+    dates, crime_count = group_count(crime_data['OCCURRED_ON_DATE'])
+    crime_data = pd.DataFrame({'OCCURRED_ON_DATE': dates, 'crime_count': crime_count})
+    weather_data = weather_data.drop(columns=['STATION', 'NAME'])
+    crime_with_weather = weather_data.merge(crime_data, left_on='DATE', right_on='OCCURRED_ON_DATE', how='inner',
+                                            validate='one_to_one')
+    crime_with_weather = crime_with_weather.drop(columns='OCCURRED_ON_DATE').set_index('DATE').rename_axis(None)
     return crime_with_weather
 
 
+def kstest_normal(data: pd.DataFrame) -> (np.ndarray, np.ndarray):
+    """
+    Run Kolmogorov-Smirnov test against normal distribution on every column at once, the mean and standard deviation
+    of the normal distribution are estimated from each column
+
+    :param data: a dataframe of numeric columns
+    :return: an array of KS statistics and an array of p-values, one value for each column
+
+    >>> d = {'TAVG':[58,59,66,65,69],'crime_count':[244,255,234,291,285]}
+    >>> statistic, pvalue = kstest_normal(pd.DataFrame(data=d))
+    >>> statistic.round(6).tolist()
+    [0.232627, 0.222013]
+    >>> pvalue.round(6).tolist()
+    [0.894105, 0.919844]
+    """
+    x = data.to_numpy(dtype=float)
+    n = x.shape[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.sort((x - x.mean(axis=0)) / x.std(axis=0, ddof=1), axis=0)
+    cdf = special.ndtr(z)
+    i = np.arange(1, n + 1)[:, None] / n
+    statistic = np.maximum(np.abs(cdf - i), np.abs(cdf - (i - 1 / n))).max(axis=0)
+    pvalue = stats.kstwo.sf(statistic, n)
+    return statistic, pvalue
+
+
 def check_distribution(crime_with_weather: pd.DataFrame):
     """
     No return values, print test result of normal distribution
@@ -35,23 +140,20 @@ def check_distribution(crime_with_weather: pd.DataFrame):
 
     >>> d = {'PRCP':[0.4,0,0,0,0],'SNOW':[0,0,0,0,0],'TAVG':[58,59,66,65,69],'crime_count':[244,255,234,291,285]}
     >>> crime = pd.DataFrame(data=d)
-    >>> check_distribution(crime)
-    normal distribution of rainfall: KstestResult(statistic=0.4726395769907116, pvalue=0.15289699769335774)
-    normal distribution of snowfall: KstestResult(statistic=nan, pvalue=nan)
-    normal distribution of average temperature: KstestResult(statistic=0.2326268961549014, pvalue=0.8941051469496969)
-    normal distribution of crime amount: KstestResult(statistic=0.2220134788993403, pvalue=0.9198439569362115)
+    >>> check_distribution(crime)  # doctest: +ELLIPSIS
+    normal distribution of rainfall: statistic=0.47263957699071..., pvalue=0.152896997693...
+    normal distribution of snowfall: statistic=nan, pvalue=nan
+    normal distribution of average temperature: statistic=0.23262689615490..., pvalue=0.894105146949...
+    normal distribution of crime amount: statistic=0.22201347889934..., pvalue=0.919843956936...
     """
-    u1, u2, u3, u4 = crime_with_weather['PRCP'].mean(), crime_with_weather['SNOW'].mean(), \
-                     crime_with_weather['TAVG'].mean(), crime_with_weather['crime_count'].mean()
-    s1, s2, s3, s4 = crime_with_weather['PRCP'].std(), crime_with_weather['SNOW'].std(), \
-                             crime_with_weather['TAVG'].std(), crime_with_weather['crime_count'].std()
-    print('normal distribution of rainfall:', stats.kstest(crime_with_weather['PRCP'], 'norm', (u1, s1)))
-    print('normal distribution of snowfall:', stats.kstest(crime_with_weather['SNOW'], 'norm', (u2, s2)))
-    print('normal distribution of average temperature:', stats.kstest(crime_with_weather['TAVG'], 'norm', (u3, s3)))
-    print('normal distribution of crime amount:', stats.kstest(crime_with_weather['crime_count'], 'norm', (u4, s4)))
+    columns = ['PRCP', 'SNOW', 'TAVG', 'crime_count']
+    names = ['rainfall', 'snowfall', 'average temperature', 'crime amount']
+    statistic, pvalue = kstest_normal(crime_with_weather[columns])
+    for name, d, p in zip(names, statistic, pvalue):
+        print('normal distribution of ' + name + ':', 'statistic=' + str(float(d)) + ', pvalue=' + str(float(p)))
 
 
-def holiday_situation(year: str, data: pd.DataFrame, low: int, high: int):
+def holiday_situation(year: str, data: pd.DataFrame, low: int, high: int, ax: plt.Axes = None):
     """
     Generate line charts by crime counts with holiday labels
 
@@ -59,12 +161,17 @@ def holiday_situation(year: str, data: pd.DataFrame, low: int, high: int):
     :param data:a dataframe of crime data
     :param low:an int for the lower limit of y-axis
     :param high:an int for the upper limit of y-axis
+    :param ax:an axes to draw on, it is cleared before drawing. A new figure is created if it is None
     :return:a line chart
 
     >>> modified_boston = pd.read_csv('prep_data/modified_boston_crime.csv')
     >>> holiday_situation('2016',modified_boston,100,350)
+    >>> fig, ax = plt.subplots(figsize=(20, 6))
+    >>> holiday_situation('2016',modified_boston,100,350,ax)
+    >>> holiday_situation('2017',modified_boston,100,350,ax)
+    >>> len(ax.lines), ax.get_xlabel()
+    (1, 'Year2017')
     """
-    grouped_date = data
     holidays = [year + '-01-01',  # New Years Day
                 year + '-01-16',  # MLK Day
                 year + '-03-17',  # St. Patrick's Day
@@ -76,16 +183,18 @@ def holiday_situation(year: str, data: pd.DataFrame, low: int, high: int):
                 year + '-11-23',  # Thanksgiving
                 year + '-12-25']  # Christmas
     holidays_names = ['NY', 'MLK', 'St Pats', 'Marathon', 'Mem', 'July 4', 'Labor', 'Vets', 'Thnx', 'Xmas']
-    grouped_date['YEAR'] = grouped_date['OCCURRED_ON_DATE'].str[:4]
-    grouped_date = grouped_date[grouped_date['YEAR'] == year]
+    grouped_date = data[data['OCCURRED_ON_DATE'].str.startswith(year)]
     grouped_date = grouped_date.groupby(['OCCURRED_ON_DATE']).size().reset_index(name='count')
-    fig, ax = plt.subplots(figsize=(20, 6))
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(20, 6))
+    else:
+        ax.clear()
     sns.lineplot(x='OCCURRED_ON_DATE', y='count', ax=ax, data=grouped_date)
-    plt.xlabel('Year' + year)
-    plt.vlines(holidays, low, high, alpha=1, color='r')
-    plt.xticks([])
-    for i in range(len(holidays)):
-        plt.text(x=holidays[i], y=high + 2, s=holidays_names[i])
+    ax.set_xlabel('Year' + year)
+    ax.vlines(holidays, low, high, alpha=1, color='r')
+    ax.set_xticks([])
+    for holiday, name in zip(holidays, holidays_names):
+        ax.text(x=holiday, y=high + 2, s=name)
 
 
 def heat_map(df: pd.DataFrame, time_unit: str):
@@ -103,20 +212,61 @@ def heat_map(df: pd.DataFrame, time_unit: str):
     >>> heat_map(df_boston, 'week')
     Please type in year, day or hour.
     """
-    if time_unit == 'year':
-        grouped_df = df.groupby(['YEAR', 'OFFENSE_CODE_GROUP']).agg({'OFFENSE_CODE': 'count'}).reset_index()
-        grouped_year = grouped_df.pivot("OFFENSE_CODE_GROUP", "YEAR", "OFFENSE_CODE")
-        ax = sns.heatmap(grouped_year)
-    elif time_unit == 'day':
-        grouped_day = df.groupby(['DAY_OF_WEEK', 'OFFENSE_CODE_GROUP']).agg({'OFFENSE_CODE': 'count'}).reset_index()
-        grouped_day = grouped_day.pivot("OFFENSE_CODE_GROUP", "DAY_OF_WEEK", "OFFENSE_CODE")
-        ax = sns.heatmap(grouped_day)
-    elif time_unit == 'hour':
-        grouped_hour = df.groupby(['HOUR', 'OFFENSE_CODE_GROUP']).agg({'OFFENSE_CODE': 'count'}).reset_index()
-        grouped_hour = grouped_hour.pivot("OFFENSE_CODE_GROUP", "HOUR", "OFFENSE_CODE")
-        ax = sns.heatmap(grouped_hour)
-    else:
+    time_columns = {'year': 'YEAR', 'day': 'DAY_OF_WEEK', 'hour': 'HOUR'}
+    if time_unit not in time_columns:
         return print('Please type in year, day or hour.')
+    column = time_columns[time_unit]
+    df = df.assign(**{c: sorted_category(df[c]) for c in ['OFFENSE_CODE_GROUP', column]})
+    grouped = df.groupby(['OFFENSE_CODE_GROUP', column], observed=True).size()
+    grouped = grouped.unstack(column, fill_value=0)
+    ax = sns.heatmap(grouped)
+
+
+def month_hash(month: str) -> int:
+    """
+    Hash a three letters month abbreviation to an index of MONTH_TABLE, it is collision free for all months
+    :param month: a str of uppercase month abbreviation likes 'JAN'
+    :return: an int between 0 and 16
+
+    >>> len({month_hash(m) for m in MONTH_NAMES})
+    12
+    """
+    return (ord(month[1]) + ord(month[2])) % 17
+
+
+def build_month_table() -> list:
+    """
+    Build the lookup table of month abbreviation and month number indexed by month_hash
+    :return: list of (month abbreviation, two digits month number) or None for unused index
+    """
+    table = [None] * 17
+    for number, name in enumerate(MONTH_NAMES, 1):
+        table[month_hash(name)] = (name, '%02d' % number)
+    return table
+
+
+MONTH_TABLE = build_month_table()
+
+
+def date_modify_series(dates: pd.Series) -> pd.Series:
+    """
+    Modify a series of dates, return a series of str likes '2021-01-01'
+
+    :param dates: a series of str of date likes '01-JAN-21'
+    :return: a series of str of date likes '2021-01-01'
+
+    >>> dates = pd.Series(['01-JAN-21', '17-MAR-16', '1-jan-21', '01-JAN-85'])
+    >>> date_modify_series(dates).tolist()
+    ['2021-01-01', '2016-03-17', '2021-01-01', '2085-01-01']
+    >>> date_modify_series(pd.Series(['17-JUX-16']))
+    Traceback (most recent call last):
+    ValueError: Invalid month value
+    """
+    parts = dates.astype(str).str.split('-', n=2, expand=True)
+    month = parts[1].str.upper().map(MONTH_NUMBERS)
+    if month.isna().any():
+        raise ValueError('Invalid month value')
+    return pd.to_datetime('20' + parts[2] + '-' + month + '-' + parts[0], format='%Y-%m-%d').dt.strftime('%Y-%m-%d')
 
 
 def date_modify(date: str) -> str:
@@ -129,13 +279,25 @@ def date_modify(date: str) -> str:
     >>> date_time = '01-JAN-21'
     >>> date_modify(date_time)
     '2021-01-01'
+    >>> date_modify('17-JUN-16')
+    '2016-06-17'
+    >>> date_modify('1-jan-21')
+    '2021-01-01'
+    >>> date_modify('17-JUX-16')
+    Traceback (most recent call last):
+    ValueError: Invalid month value
+    >>> date_modify('01-Ja-21')
+    Traceback (most recent call last):
+    ValueError: Invalid month value
     """
-    month_list = {'JAN': '01', 'FEB': '02', 'MAR': '03', 'APR': '04', 'MAY': '05', 'JUN': '06', 'JUL': '07',
-                  'AUG': '08', 'SEP': '09', 'OCT': '10', 'NOV': '11', 'DEC': '12'}
-    date = str(date).split('-')
-    month = month_list[date[1]]
-    year = '20' + date[2]
-    return year + '-' + month + '-' + date[0]
+    day, month, year = str(date).split('-')
+    month = month.upper()
+    if len(month) != 3:
+        raise ValueError('Invalid month value')
+    month_name, month_number = MONTH_TABLE[month_hash(month)] or (None, None)
+    if month_name != month:
+        raise ValueError('Invalid month value')
+    return '20' + year + '-' + month_number + '-' + day.zfill(2)
 
 
 def add_df(df1: pd.DataFrame, df2: pd.DataFrame, time_unit: str) -> pd.DataFrame:
@@ -155,10 +317,24 @@ def add_df(df1: pd.DataFrame, df2: pd.DataFrame, time_unit: str) -> pd.DataFrame
        YEAR
     0  2019
     1  2020
+    >>> d3 = {'OFFENSE_CODE_GROUP':['Larceny', 'Larceny'],'YEAR':[2019, 2020],'OFFENSE_CODE':[3, 4]}
+    >>> d4 = {'OFFENSE_CODE_GROUP':['Auto Theft'],'YEAR':[2020],'OFFENSE_CODE':[2]}
+    >>> add_df(pd.DataFrame(data=d3), pd.DataFrame(data=d4), 'YEAR')
+       YEAR  OFFENSE_CODE
+    0  2019             3
+    1  2020             6
+    """
+    df3 = pd.concat([df1, df2], ignore_index=True).drop(columns='OFFENSE_CODE_GROUP')
+    return df3.groupby(time_unit, as_index=False, observed=True).sum()
+
+
+@lru_cache(maxsize=1)
+def _load_boston_building_inventory() -> pd.DataFrame:
     """
-    df3 = df1.drop(columns='OFFENSE_CODE_GROUP').set_index(time_unit).add(
-        df2.drop(columns='OFFENSE_CODE_GROUP').set_index(time_unit))
-    return df3.reset_index()
+    Load Boston building inventory data once, later calls reuse the parsed dataframe
+    :return: dataframe of data
+    """
+    return read_csv('data/boston_building_inventory.csv', usecols=BOSTON_BUILDING_COLUMNS)
 
 
 def preprocessing_hypothesis_3() -> pd.DataFrame:
@@ -172,15 +348,12 @@ def preprocessing_hypothesis_3() -> pd.DataFrame:
     >>> df.shape
     (89283, 7)
     """
-    boston_bldg_all = pd.read_csv('data/boston_building_inventory.csv', engine='python')
-    boston_bldg_all.head()
-    df_boston_bldg = boston_bldg_all[
-        ['id', 'building_typology', 'st_name', 'st_name_suf', 'ct_perc_income_200000_or_more',
-         'ct_perc_low_to_no_income']]
-    df_boston_bldg['st_name'] = df_boston_bldg['st_name'].str.strip()
-    df_boston_bldg['st_name_suf'] = df_boston_bldg['st_name_suf'].str.strip()
-    df_boston_bldg['st_loc'] = df_boston_bldg['st_name'] + ' ' + df_boston_bldg['st_name_suf']
-    df_boston_bldg.dropna(subset=['st_loc'], inplace=True)
+    boston_bldg_all = _load_boston_building_inventory()
+    st_name = boston_bldg_all['st_name'].str.strip()
+    st_name_suf = boston_bldg_all['st_name_suf'].str.strip()
+    df_boston_bldg = boston_bldg_all[BOSTON_BUILDING_COLUMNS].assign(st_name=st_name, st_name_suf=st_name_suf,
+                                                                     st_loc=st_name.str.cat(st_name_suf, sep=' '))
+    df_boston_bldg = df_boston_bldg.dropna(subset=['st_loc'])
     df_boston_bldg.to_csv('prep_data/boston_bldg_st.csv', encoding='utf-8', index=False)
     return df_boston_bldg
 
@@ -210,24 +383,43 @@ def boston_building_category_group_by_street(df_boston_bldg: pd.DataFrame, colum
     return boston_bldg_by_category
 
 
+@lru_cache(maxsize=1)
+def _load_boston_crime() -> pd.DataFrame:
+    """
+    Load crime data in Boston once, later calls reuse the parsed dataframe
+    :return: dataframe of data
+    """
+    data = read_csv('data/boston_crime.csv', usecols=BOSTON_CRIME_COLUMNS, dtype=BOSTON_CRIME_DTYPES)
+    return data.assign(**{c: sorted_category(data[c]) for c, t in BOSTON_CRIME_DTYPES.items() if t == 'category'})
+
+
 def get_boston_crime() -> pd.DataFrame:
     """
-    Load entire crime data in Boston
+    Load crime data in Boston, only columns used in the analysis are kept
     :return: dataframe of data
     """
-    return pd.read_csv('data/boston_crime.csv', dtype={'SHOOTING': str})
+    return _load_boston_crime().copy(deep=False)
 
 
-def get_building_typology() -> pd.DataFrame:
+@lru_cache(maxsize=1)
+def _load_building_typology() -> pd.DataFrame:
     """
-    Load data file and change column names
+    Load building typology data once, later calls reuse the parsed dataframe
     :return: dataframe of data
     """
-    data = pd.read_csv('prep_data/boston_bldg_by_building_typology.csv')
+    data = read_csv('prep_data/boston_bldg_by_building_typology.csv')
     data.columns = ['st_loc', 'typology', 'count']
     return data
 
 
+def get_building_typology() -> pd.DataFrame:
+    """
+    Load data file and change column names
+    :return: dataframe of data
+    """
+    return _load_building_typology().copy(deep=False)
+
+
 def get_crime_group_by_street() -> pd.DataFrame:
     """
     Load Boston crime data, group by street and count the amount of crime
@@ -240,9 +432,8 @@ def get_crime_group_by_street() -> pd.DataFrame:
     (5411, 2)
     """
     data = get_boston_crime()
-    data_by_street = data.groupby(['STREET']).size()
-    data_by_street = data_by_street.reset_index()
-    data_by_street.columns = ['street', 'crime_count']
+    streets, crime_count = group_count(data['STREET'])
+    data_by_street = pd.DataFrame({'street': streets, 'crime_count': crime_count})
     data_by_street = data_by_street.astype({'street': str})
     return data_by_street
 
@@ -259,9 +450,8 @@ def get_crime_group_by_street_year() -> pd.DataFrame:
     (20868, 3)
     """
     data = get_boston_crime()
-    data_street_per_year = data.groupby(['STREET', 'YEAR']).size()
-    data_street_per_year = data_street_per_year.reset_index()
-    data_street_per_year.columns = ['street', 'year', 'crime_count']
+    streets, years, crime_count = pair_group_count(data['STREET'], data['YEAR'])
+    data_street_per_year = pd.DataFrame({'street': streets, 'year': years.astype(np.int64), 'crime_count': crime_count})
     return data_street_per_year
 
 
@@ -285,12 +475,10 @@ def street_avg_group(df_bldg: pd.DataFrame, df_crime_by_street: pd.DataFrame, y_
     df_bldg.columns = ['street', y_label]
     df_bldg.dropna(inplace=True)
     df_bldg = df_bldg.astype({'street': str})
-    bldg_group_street_crime = pd.merge(df_bldg, df_crime_by_street)
-    bldg_group_street_crime = bldg_group_street_crime.astype({y_label: float})
-    bldg_group_street_crime.sort_values(by=y_label, inplace=True)
-    bldg_group_street_crime['chart_group'] = bldg_group_street_crime[y_label].apply(lambda x: int(x / 5) * 5)
-    bldg_group_street_crime_group = bldg_group_street_crime.groupby('chart_group').agg(
-        {'crime_count': 'sum'}).reset_index()
+    bldg_group_street_crime = pd.merge(df_bldg, df_crime_by_street, on='street', validate='one_to_one')
+    perc = bldg_group_street_crime[y_label].to_numpy(dtype=float)
+    bldg_group_street_crime['chart_group'] = (perc // 5).astype(np.int64) * 5
+    bldg_group_street_crime_group = bldg_group_street_crime.groupby('chart_group')['crime_count'].sum().reset_index()
     bldg_group_street_crime_group.columns = ['group', 'crime_count']
     return bldg_group_street_crime_group
 
@@ -322,18 +510,39 @@ def preprocessing_hypothesis_4():
 
     >>> preprocessing_hypothesis_4()
     """
-    boston_bldg = pd.read_csv('prep_data/boston_bldg_st.csv')
+    boston_bldg = read_csv('prep_data/boston_bldg_st.csv')
     boston_bldg_by_building_typology = boston_bldg.groupby(['st_loc', 'building_typology']).size()
     boston_bldg_by_building_typology.to_csv('prep_data/boston_bldg_by_building_typology.csv', encoding='utf-8')
+    _load_building_typology.cache_clear()
+
+
+def build_crime_by_year_index(df_boston_crime_street_per_year: pd.DataFrame) -> dict:
+    """
+    Split crime data group by street and year into one dataframe per year indexed by street. Build it once and pass it
+    to bldg_typology_crime_count_per_year when counting several years
+    :param df_boston_crime_street_per_year: dataframe of crime data group by street and year
+    :return: dict of year and dataframe of crime count indexed by street
+
+    >>> df = pd.DataFrame([['A ST', 2015, 3], ['B ST', 2015, 1], ['A ST', 2016, 2]],
+    ... columns=['street', 'year', 'crime_count'])
+    >>> crime_by_year = build_crime_by_year_index(df)
+    >>> sorted(crime_by_year)
+    [2015, 2016]
+    >>> crime_by_year[2015]['crime_count'].to_dict()
+    {'A ST': 3, 'B ST': 1}
+    """
+    return {int(y): sub.set_index('street') for y, sub in df_boston_crime_street_per_year.groupby('year', sort=False)}
 
 
 def bldg_typology_crime_count_per_year(df_typology: pd.DataFrame, df_boston_crime_street_per_year: pd.DataFrame,
-                                       year: int) -> pd.DataFrame:
+                                       year: int, crime_by_year: dict = None) -> pd.DataFrame:
     """
     Select crime data for certain year. Combine crime data and typology data by location. Then group the table by typology
     :param df_typology: dataframe of Boston building typology
     :param df_boston_crime_street_per_year: dataframe of crime data group by street
     :param year: int of year, like 2018
+    :param crime_by_year: optional result of build_crime_by_year_index for the same crime data, used instead of
+    scanning the dataframe for the year
     :return: dataframe of result
 
     >>> bldg_typology = get_building_typology()
@@ -341,14 +550,25 @@ def bldg_typology_crime_count_per_year(df_typology: pd.DataFrame, df_boston_crim
     >>> bldg_typology_2016 = bldg_typology_crime_count_per_year(bldg_typology, crime_by_street_year, 2016)
     >>> bldg_typology_2016.shape
     (21, 2)
+    >>> crime_by_year = build_crime_by_year_index(crime_by_street_year)
+    >>> bldg_typology_crime_count_per_year(bldg_typology, crime_by_street_year, 2016, crime_by_year).equals(
+    ... bldg_typology_2016)
+    True
     >>> bldg_typology_2200 = bldg_typology_crime_count_per_year(bldg_typology, crime_by_street_year, 2200)
     Traceback (most recent call last):
     ValueError: Invalid year value
+    >>> bldg_typology_2200 = bldg_typology_crime_count_per_year(bldg_typology, crime_by_street_year, 2200, crime_by_year)
+    Traceback (most recent call last):
+    ValueError: Invalid year value
     """
-    crime_per_year = df_boston_crime_street_per_year[df_boston_crime_street_per_year.year == year]
-    if len(crime_per_year) == 0:
+    if crime_by_year is not None:
+        crime_per_year = crime_by_year.get(year)
+    else:
+        crime_per_year = df_boston_crime_street_per_year[df_boston_crime_street_per_year.year == year]
+        crime_per_year = crime_per_year.set_index('street')
+    if crime_per_year is None or len(crime_per_year) == 0:
         raise ValueError('Invalid year value')
-    typology_crime = df_typology.merge(crime_per_year, left_on='st_loc', right_on='street')
+    typology_crime = df_typology.join(crime_per_year, on='st_loc', how='inner', validate='many_to_one')
     typology_crime_group = typology_crime.groupby(['typology']).agg({'crime_count': 'sum'})
     typology_crime_group.reset_index(inplace=True)
     typology_crime_group.columns = ['typology', year]
@@ -368,10 +588,9 @@ def convert_to_perc(the_df: pd.DataFrame) -> pd.DataFrame:
     >>> converted_df.iloc[1, 2]
     25.0
     """
-    df_perc = the_df.copy()
-    df_perc['perc'] = the_df.iloc[:, 1] / sum(the_df.iloc[:, 1]) * 100
-    df_perc['year'] = the_df.columns[1]
-    return df_perc[['typology', 'year', 'perc']]
+    amount = the_df.iloc[:, 1].to_numpy()
+    return pd.DataFrame({'typology': the_df['typology'].to_numpy(), 'year': the_df.columns[1],
+                         'perc': amount * (100.0 / amount.sum())}, index=the_df.index)
 
 
 def get_crime_nearby(df_typology: pd.DataFrame, typology: str, df_boston_crime: pd.DataFrame) -> pd.DataFrame:
@@ -398,6 +617,29 @@ def get_crime_nearby(df_typology: pd.DataFrame, typology: str, df_boston_crime:
     return fire_nearby_crime
 
 
+def offense_group_percentage_array(nearby_crime_group: pd.DataFrame) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Based on crime group dataframe, remove the crime category which the maximum amount in 5 years is less than 200.
+    Calculate the percentage of each crime in each year and store in a 2D array
+    :param nearby_crime_group: dataframe of offense, year and count
+    :return: array of offense groups, array of years and 2D array of percentage with one row for each offense group
+
+    >>> df = pd.DataFrame([['Aggravated Assault',2015,199], ['Aggravated Assault',2016,296],
+    ... ['Aircraft',2015,1], ['Aircraft',2016,1]], columns=['OFFENSE', 'YEAR', 'COUNT'])
+    >>> offenses, years, perc = offense_group_percentage_array(df)
+    >>> offenses.tolist(), years.tolist(), perc.shape
+    (['Aggravated Assault'], [2015, 2016, 2017, 2018, 2019, 2020], (1, 6))
+    >>> perc.round(6).tolist()
+    [[99.5, 99.6633, 0.0, 0.0, 0.0, 0.0]]
+    """
+    year = list(range(2015, 2021))
+    offense_count = nearby_crime_group.pivot_table(index='OFFENSE', columns='YEAR', values='COUNT', aggfunc='sum',
+                                                   fill_value=0).reindex(columns=year, fill_value=0)
+    offense_perc = offense_count.div(offense_count.sum(axis=0), axis=1).fillna(0) * 100
+    offense_perc = offense_perc[offense_count.max(axis=1) >= 200]
+    return offense_perc.index.to_numpy(), offense_perc.columns.to_numpy(), offense_perc.to_numpy()
+
+
 def extract_offense_group_percentage(nearby_crime_group: pd.DataFrame) -> (list, dict):
     """
     Based on crime group dataframe, remove the crime category which the maximum amount in 5 years is less than 200.
@@ -416,19 +658,5 @@ def extract_offense_group_percentage(nearby_crime_group: pd.DataFrame) -> (list,
     >>> offense_year
     {'Aggravated Assault': [99.5, 99.66329966329967, 98.79154078549848, 99.72144846796658, 100.0, 100.0]}
     """
-    year = list(range(2015, 2021))
-    offenses = set(nearby_crime_group['OFFENSE'])
-    offense_by_year = {}
-    for offense in offenses:
-        if nearby_crime_group[nearby_crime_group['OFFENSE'] == offense]['COUNT'].max() < 200:
-            continue
-        count_list = []
-        for y in year:
-            count = nearby_crime_group[(nearby_crime_group['YEAR'] == y) & (nearby_crime_group['OFFENSE'] == offense)]
-            year_sum = nearby_crime_group[nearby_crime_group['YEAR'] == y]['COUNT'].sum()
-            if len(count) > 0:
-                count_list.append(count.iloc[0, 2] / year_sum * 100)
-            else:
-                count_list.append(0)
-        offense_by_year[offense] = count_list
-    return year, offense_by_year
+    offenses, years, perc = offense_group_percentage_array(nearby_crime_group)
+    return years.tolist(), dict(zip(offenses.tolist(), perc.tolist()))